@@ -1,68 +1,86 @@
 import asyncio
 import httpx
+import ssl
 import time
 import sys
 import os
 
+# Build the SSL context once instead of once per client
+try:
+    import certifi
+    _SSL_CTX = ssl.create_default_context(cafile=certifi.where())
+except ImportError:
+    _SSL_CTX = ssl.create_default_context()
+
 # ANSI Colors for terminal output
 GREEN = "\033[92m"
 RED = "\033[91m"
 RESET = "\033[0m"
 
-async def test_connection(name, url):
-    print(f"Testing {name}...", end=" ", flush=True)
+async def test_connection(client, name, url, out):
+    # Output goes into `out` so parallel probes can be printed in order afterwards
+    line = f"Testing {name}... "
     start = time.time()
     try:
-        # We mimic a browser to avoid being blocked by anti-bot protections
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Test/1.0"}
+        resp = await client.get(url)
+        duration = round((time.time() - start) * 1000, 2)
         
-        async with httpx.AsyncClient(headers=headers, timeout=10.0) as client:
-            resp = await client.get(url)
-            duration = round((time.time() - start) * 1000, 2)
-            
-            if resp.status_code == 200:
-                print(f"{GREEN}SUCCESS{RESET} ({duration}ms) - Status: 200")
-                return True
-            else:
-                print(f"{RED}FAILED{RESET} - Status Code: {resp.status_code}")
-                return False
+        if resp.status_code == 200:
+            out.append(line + f"{GREEN}SUCCESS{RESET} ({duration}ms) - Status: 200")
+            return True
+        else:
+            out.append(line + f"{RED}FAILED{RESET} - Status Code: {resp.status_code}")
+            return False
                 
     except httpx.ConnectTimeout:
-        print(f"{RED}TIMEOUT{RESET} - Server took too long to respond (Firewall/Slow Net?)")
+        out.append(line + f"{RED}TIMEOUT{RESET} - Server took too long to respond (Firewall/Slow Net?)")
     except httpx.ConnectError as e:
-        print(f"{RED}CONNECTION ERROR{RESET} - Could not reach server. (DNS/Offline?)")
-        print(f"  -> Detail: {e}")
+        out.append(line + f"{RED}CONNECTION ERROR{RESET} - Could not reach server. (DNS/Offline?)")
+        out.append(f"  -> Detail: {e}")
     except httpx.SSLError as e:
-        print(f"{RED}SSL ERROR{RESET} - Certificate verification failed.")
-        print(f"  -> Detail: {e}")
+        out.append(line + f"{RED}SSL ERROR{RESET} - Certificate verification failed.")
+        out.append(f"  -> Detail: {e}")
     except Exception as e:
-        print(f"{RED}ERROR{RESET} - {type(e).__name__}: {e}")
+        out.append(line + f"{RED}ERROR{RESET} - {type(e).__name__}: {e}")
     return False
 
 async def main():
     print("--- 🔍 ToxiScan Network Diagnostic Tool ---\n")
-    
-    # 1. Basic Internet Check
-    internet = await test_connection("Google (Connectivity Check)", "https://www.google.com")
-    if not internet:
-        print("\n❌ CRITICAL: You seem to be offline or Google is blocked.")
-        return
 
-    print("\n--- API Checks ---")
-    
-    # 2. OpenFoodFacts
-    await test_connection("OpenFoodFacts API", "https://world.openfoodfacts.org/api/v2/additive/e330")
-    
-    # 3. Wikipedia
-    await test_connection("Wikipedia API", "https://en.wikipedia.org/api/rest_v1/page/summary/Citric_Acid")
-    
-    # 4. USDA
-    usda_key = os.getenv("USDA_API_KEY", "DEMO_KEY") # Use env var or fake one just to test reachability
-    usda_url = f"https://api.nal.usda.gov/fdc/v1/foods/search?api_key={usda_key}&query=apple"
-    await test_connection("USDA API", usda_url)
+    # We mimic a browser to avoid being blocked by anti-bot protections
+    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Test/1.0"}
+
+    async with httpx.AsyncClient(headers=headers, timeout=10.0, verify=_SSL_CTX) as client:
+        # 1. Basic Internet Check
+        out = []
+        internet = await test_connection(client, "Google (Connectivity Check)", "https://www.google.com", out)
+        print("\n".join(out))
+        if not internet:
+            print("\n❌ CRITICAL: You seem to be offline or Google is blocked.")
+            return
+
+        print("\n--- API Checks ---")
+
+        usda_key = os.getenv("USDA_API_KEY", "DEMO_KEY") # Use env var or fake one just to test reachability
+        probes = [
+            # 2. OpenFoodFacts
+            ("OpenFoodFacts API", "https://world.openfoodfacts.org/api/v2/additive/e330"),
+            # 3. Wikipedia
+            ("Wikipedia API", "https://en.wikipedia.org/api/rest_v1/page/summary/Citric_Acid"),
+            # 4. USDA
+            ("USDA API", f"https://api.nal.usda.gov/fdc/v1/foods/search?api_key={usda_key}&query=apple"),
+            # 5. PubChem
+            ("PubChem API", "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/aspirin/cids/JSON"),
+        ]
 
-    # 5. PubChem
-    await test_connection("PubChem API", "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/aspirin/cids/JSON")
+        # The API probes are independent, so run them concurrently
+        buffers = [[] for _ in probes]
+        await asyncio.gather(*(
+            test_connection(client, name, url, buf)
+            for (name, url), buf in zip(probes, buffers)
+        ))
+        for buf in buffers:
+            print("\n".join(buf))
 
     print("\n--- Diagnosis ---")
     print("If specific APIs failed but Google worked, your IP might be rate-limited or blocked.")
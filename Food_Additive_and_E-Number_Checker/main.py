@@ -1,17 +1,33 @@
 import os
+import pickle
 import re
 import asyncio
+import bisect
 import logging
-import traceback
+import ssl
+import time
 import urllib.parse
+from collections import OrderedDict, defaultdict
 from contextlib import asynccontextmanager
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Set, Tuple
 
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
 import httpx
+import orjson
+
+try:
+    import ahocorasick
+except ImportError:  # Optional: fall back to plain substring scans
+    ahocorasick = None
+
+try:
+    import hishel
+except ImportError:  # Optional: no HTTP-level response cache
+    hishel = None
 
 load_dotenv()
 
@@ -24,8 +40,44 @@ OFF_SEARCH_URL = "https://world.openfoodfacts.org/api/v2/search"
 WIKI_API_URL = "https://en.wikipedia.org/api/rest_v1/page/summary"
 PUBCHEM_CID_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{}/cids/JSON"
 PUBCHEM_IMG_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{}/PNG?record_type=2d&image_size=300x300"
+PUBCHEM_NAME_IMG_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{}/PNG?record_type=2d&image_size=300x300"
+
+# --- Caching ---
+TAXONOMY_CACHE_FILE = "additive_taxonomy.pkl"
+TAXONOMY_MAX_AGE = 24 * 60 * 60 # Refresh the on-disk copy once a day
+TAXONOMY_STARTUP_TIMEOUT = 10.0 # Max seconds startup waits on OFF when there's no disk copy
+TAXONOMY_RETRY_MIN = 5 # Backoff between taxonomy retries when startup couldn't load it...
+TAXONOMY_RETRY_MAX = 5 * 60 # ...doubling up to this
+ANALYZE_CACHE_SIZE = 2048
+ANALYZE_CACHE_TTL = 60 * 60 # Seconds an analysis result stays valid
+HTTP_CACHE_TTL = 24 * 60 * 60 # Upstream responses (hishel) kept for a day
+# Per-request hishel extensions. Additive lookups barely change, so those are
+# cached even without Cache-Control; USDA URLs carry the API key, so never store them.
+FORCE_CACHE = {"force_cache": True}
+NO_CACHE = {"cache_disabled": True}
 
 API_HEADERS = {"User-Agent": "ToxiScan-StudentProject/1.0"}
+# Per-upstream budgets (seconds). A slow source is dropped instead of
+# holding the whole response; the client's 20s timeout is the safety net.
+UPSTREAM_TIMEOUTS = {"off": 3.0, "wiki": 3.0, "usda": 5.0, "products": 5.0, "pubchem": 4.0}
+# httpx only resolves DNS when it opens a connection, so busy keep-alive
+# connections would stay pinned to one IP forever. Replace the connection
+# pool on this interval so geo-DNS changes get picked up.
+POOL_RECYCLE_INTERVAL = 5 * 60
+POOL_CLOSE_GRACE = 30 # Longer than the 20s request timeout
+
+# Compiled once: "E330 - Citric Acid" prefix stripper and code/name splitter
+_E_PREFIX_RE = re.compile(r'^[eE]\d+\s*[-–]\s*')
+_E_SPLIT_RE = re.compile(r'^([eE]\d+)\s*[-–_]\s*(.+)$')
+_E_CODE_RE = re.compile(r'[eE]\d+[a-zA-Z]?') # A bare code such as "e330" or "e150a"
+
+# Building an SSL context is the slowest part of creating an httpx client,
+# so do it once at import time and hand it to every client we open.
+try:
+    import certifi
+    _SSL_CTX = ssl.create_default_context(cafile=certifi.where())
+except ImportError:
+    _SSL_CTX = ssl.create_default_context()
 
 # --- Hybrid Safety Logic: Hardcoded Overrides ---
 KNOWN_RISKS = {
@@ -41,43 +93,241 @@ KNOWN_RISKS = {
     "e924": "high" # Potassium bromate
 }
 
+# --- Text Analysis Keywords (checked in priority order) ---
+# All lowercase: they are matched against description.lower()
+SAFETY_KEYWORDS = {
+    "high": frozenset({"carcinogen", "cancer", "banned", "toxic", "dna damage"}),
+    "moderate": frozenset({"hyperactivity", "allergy", "asthma", "migraine", "intolerance", "children"}),
+}
+ORIGIN_KEYWORDS = {
+    "synthetic": frozenset({"petroleum", "artificial", "synthetic", "lab", "chemical synthesis", "coal tar", "preservative"}),
+    "natural": frozenset({"plant", "extracted", "natural", "fruit", "vegetable", "fermentation", "animal", "vitamin", "mineral"}),
+}
+
+def _build_automaton(groups: dict):
+    """Aho-Corasick automaton over every keyword, so one pass over the text finds all of them."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for category, keywords in groups.items():
+        for kw in keywords:
+            automaton.add_word(kw, (category, kw))
+    automaton.make_automaton()
+    return automaton
+
+_SAFETY_AC = _build_automaton(SAFETY_KEYWORDS)
+_ORIGIN_AC = _build_automaton(ORIGIN_KEYWORDS)
+
 # --- Global Storage ---
 additive_taxonomy: Dict[str, str] = {}
 taxonomy_list: List[str] = []
+# Autocomplete index: (lowered, original) pairs sorted by the lowered key
+_lower_index: List[Tuple[str, str]] = []
+_lower_keys: List[str] = []
+# Trigram -> positions in _lower_index, for substring lookups
+_trigrams: Dict[str, Set[int]] = {}
+# LRU of finished analyses: query -> (expiry time, response body)
+_analyze_cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+# Upstream GETs currently in flight, keyed by full URL (single-flight)
+_inflight: Dict[str, asyncio.Future] = {}
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ToxiScan")
 
+def build_search_index():
+    """Pre-lowercase and sort taxonomy_list once so autocomplete can bisect."""
+    _lower_index[:] = sorted((s.lower(), s) for s in taxonomy_list)
+    _lower_keys[:] = [k for k, _ in _lower_index]
+
+    trigrams = defaultdict(set)
+    for i, key in enumerate(_lower_keys):
+        for j in range(len(key) - 2):
+            trigrams[key[j:j + 3]].add(i)
+    _trigrams.clear()
+    _trigrams.update(trigrams)
+
+def parse_taxonomy(data: dict) -> Tuple[Dict[str, str], List[str]]:
+    """Turn the raw OFF taxonomy JSON into (lookup dict, autocomplete list)."""
+    pairs = [
+        (key.split(':')[-1].lower(), names.get('en') if (names := value.get('name')) else None)
+        for key, value in data.items()
+    ]
+    
+    taxonomy = {code: code for code, _ in pairs}
+    taxonomy.update({name.lower(): code for code, name in pairs if name})
+    entries = [code for code, _ in pairs]
+    entries.extend(name for _, name in pairs if name)
+    return taxonomy, entries
+
+def install_taxonomy(taxonomy: Dict[str, str], entries: List[str]):
+    """Swap in a new taxonomy and rebuild the autocomplete index."""
+    additive_taxonomy.clear()
+    additive_taxonomy.update(taxonomy)
+    taxonomy_list[:] = entries
+    build_search_index()
+    # Cached analyses resolved codes against the old taxonomy
+    _analyze_cache.clear()
+
+def load_cached_taxonomy() -> bool:
+    """Load the pickled taxonomy from disk. Returns False if missing or unreadable."""
+    try:
+        with open(TAXONOMY_CACHE_FILE, "rb") as f:
+            taxonomy, entries = pickle.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.warning(f"⚠️ Taxonomy cache unreadable: {e}")
+        return False
+    install_taxonomy(taxonomy, entries)
+    logger.info(f"✅ Taxonomy Loaded from cache: {len(taxonomy_list)} entries ready.")
+    return True
+
+async def refresh_taxonomy(client) -> bool:
+    """Fetch the taxonomy from OFF, swap it in and rewrite the disk cache. Returns True once loaded."""
+    try:
+        logger.info("⏳ Loading Additive Taxonomy...")
+        resp = await client.get(OFF_TAXONOMY_URL, timeout=15.0)
+        if resp.status_code != 200:
+            logger.warning(f"⚠️ Taxonomy failed to load. Status: {resp.status_code}")
+            return False
+        taxonomy, entries = parse_taxonomy(orjson.loads(resp.content))
+        install_taxonomy(taxonomy, entries)
+        logger.info(f"✅ Taxonomy Loaded: {len(taxonomy_list)} entries ready.")
+    except Exception as e:
+        logger.error(f"❌ Taxonomy Error: {e}")
+        return False
+
+    try:
+        # Write to a temp file first so a crash never leaves a half-written cache
+        tmp_path = TAXONOMY_CACHE_FILE + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((taxonomy, entries), f)
+        os.replace(tmp_path, TAXONOMY_CACHE_FILE)
+    except OSError as e:
+        logger.warning(f"⚠️ Could not write taxonomy cache: {e}")
+    return True
+
+async def retry_taxonomy(app: FastAPI):
+    """Keep retrying the taxonomy fetch with exponential backoff until it loads."""
+    delay = TAXONOMY_RETRY_MIN
+    while True:
+        await asyncio.sleep(delay)
+        if await refresh_taxonomy(app.state.client):
+            return
+        delay = min(delay * 2, TAXONOMY_RETRY_MAX)
+
+def build_pool_transport() -> httpx.AsyncHTTPTransport:
+    """The actual connection pool used for upstream calls."""
+    # verify/limits live on the transport: a client given a custom transport ignores its own
+    # HTTP/2 lets the parallel fetches to one host share a single multiplexed connection
+    return httpx.AsyncHTTPTransport(
+        verify=_SSL_CTX,
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30.0),
+    )
+
+class RecyclingTransport(httpx.AsyncBaseTransport):
+    """
+    Forwards to a connection pool that can be swapped for a fresh one, so new
+    connections re-resolve DNS while the client and cache layer above stay put.
+    """
+    def __init__(self):
+        self._pool = build_pool_transport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pool.handle_async_request(request)
+
+    async def recycle(self):
+        old_pool = self._pool
+        self._pool = build_pool_transport()
+        try:
+            # Requests still running on the old pool get time to finish
+            await asyncio.sleep(POOL_CLOSE_GRACE)
+        finally:
+            await old_pool.aclose()
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+def build_http_client(pool: httpx.AsyncBaseTransport) -> httpx.AsyncClient:
+    """Shared client for all upstream calls, with an HTTP response cache if hishel is installed."""
+    transport = pool
+    if hishel is not None:
+        # Normal Cache-Control handling by default; fetchers opt in with FORCE_CACHE
+        transport = hishel.AsyncCacheTransport(
+            transport=pool,
+            storage=hishel.AsyncSQLiteStorage(ttl=HTTP_CACHE_TTL),
+            controller=hishel.Controller(cacheable_methods=["GET"], cacheable_status_codes=[200]),
+        )
+    return httpx.AsyncClient(
+        headers=API_HEADERS,
+        transport=transport,
+        timeout=httpx.Timeout(20.0, connect=5.0),
+    )
+
+async def recycle_pool(pool: RecyclingTransport):
+    """Periodically replace the connection pool so new connections re-resolve DNS."""
+    while True:
+        await asyncio.sleep(POOL_RECYCLE_INTERVAL)
+        await pool.recycle()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Load taxonomy on startup."""
-    async with httpx.AsyncClient(headers=API_HEADERS, timeout=15.0) as client:
+    """Create the shared HTTP client and load taxonomy on startup."""
+    # One client (and one cache storage) for the process; only the pool underneath is recycled
+    pool = RecyclingTransport()
+    app.state.client = build_http_client(pool)
+
+    # Stale-while-revalidate: serve the disk copy straight away and only
+    # refresh it in the background once it's older than TAXONOMY_MAX_AGE.
+    refresh_task = None
+    if load_cached_taxonomy():
+        age = time.time() - os.path.getmtime(TAXONOMY_CACHE_FILE)
+        if age > TAXONOMY_MAX_AGE:
+            refresh_task = asyncio.create_task(refresh_taxonomy(app.state.client))
+    else:
         try:
-            logger.info("⏳ Loading Additive Taxonomy...")
-            resp = await client.get(OFF_TAXONOMY_URL)
-            if resp.status_code == 200:
-                data = resp.json()
-                for key, value in data.items():
-                    code = key.split(':')[-1].lower()
-                    additive_taxonomy[code] = code
-                    taxonomy_list.append(code)
-                    
-                    names = value.get('name', {})
-                    if 'en' in names:
-                        name_lower = names['en'].lower()
-                        additive_taxonomy[name_lower] = code
-                        taxonomy_list.append(names['en'])
-                logger.info(f"✅ Taxonomy Loaded: {len(taxonomy_list)} entries ready.")
-            else:
-                logger.warning(f"⚠️ Taxonomy failed to load. Status: {resp.status_code}")
-        except Exception as e:
-            logger.error(f"❌ Taxonomy Error: {e}")
+            loaded = await asyncio.wait_for(refresh_taxonomy(app.state.client), timeout=TAXONOMY_STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Taxonomy not loaded within {TAXONOMY_STARTUP_TIMEOUT}s.")
+            loaded = False
+        if not loaded:
+            # Boot anyway with an empty index and retry with backoff until OFF answers
+            logger.warning("⚠️ Starting with an empty taxonomy index, retrying in the background.")
+            refresh_task = asyncio.create_task(retry_taxonomy(app))
+
+    recycle_task = asyncio.create_task(recycle_pool(pool))
     yield
+    recycle_task.cancel()
+    if refresh_task:
+        refresh_task.cancel()
+    # Wait for the cancellations to land, so recycle's finally closes the old pool it's holding
+    await asyncio.gather(recycle_task, *([refresh_task] if refresh_task else []), return_exceptions=True)
+    await app.state.client.aclose()
 
-app = FastAPI(lifespan=lifespan)
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (FastAPI's own ORJSONResponse is deprecated)."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 templates = Jinja2Templates(directory=".")
 
 # --- Helper Logic ---
+def match_category(text: str, groups: dict, automaton):
+    """Return the highest-priority category with a keyword in text, or None."""
+    order = list(groups)
+    if automaton is None:
+        return next((cat for cat in order if any(k in text for k in groups[cat])), None)
+
+    best = None
+    for _, (category, _) in automaton.iter(text):
+        if category == order[0]:
+            return category
+        if best is None or order.index(category) < order.index(best):
+            best = category
+    return best
+
 def analyze_safety(data: dict, code: str, description: str) -> dict:
     """
     Determines safety using 3 checks:
@@ -93,7 +343,8 @@ def analyze_safety(data: dict, code: str, description: str) -> dict:
 
     # Check 2: API Data (OpenFoodFacts)
     elif data:
-        api_risk = data.get("overexposure_risk", {}).get("risk")
+        exposure = data.get("overexposure_risk")
+        api_risk = exposure.get("risk") if exposure else None
         if api_risk:
             risk_level = api_risk
 
@@ -101,13 +352,7 @@ def analyze_safety(data: dict, code: str, description: str) -> dict:
     # If we still think it's low, scan the text for danger words
     if risk_level == "low" and description:
         text = description.lower()
-        high_keywords = ["carcinogen", "cancer", "banned", "toxic", "DNA damage"]
-        mod_keywords = ["hyperactivity", "allergy", "asthma", "migraine", "intolerance", "children"]
-        
-        if any(k in text for k in high_keywords):
-            risk_level = "high"
-        elif any(k in text for k in mod_keywords):
-            risk_level = "moderate"
+        risk_level = match_category(text, SAFETY_KEYWORDS, _SAFETY_AC) or risk_level
 
     # --- Return the correct badge ---
     if risk_level == "high":
@@ -120,78 +365,150 @@ def analyze_safety(data: dict, code: str, description: str) -> dict:
 def analyze_origin(summary: str) -> str:
     if not summary: return "Origin Unknown"
     text = summary.lower()
-    synthetic = ["petroleum", "artificial", "synthetic", "lab", "chemical synthesis", "coal tar", "preservative"]
-    natural = ["plant", "extracted", "natural", "fruit", "vegetable", "fermentation", "animal", "vitamin", "mineral"]
+    origin = match_category(text, ORIGIN_KEYWORDS, _ORIGIN_AC)
     
-    if any(k in text for k in synthetic): return "Synthetic / Artificial"
-    if any(k in text for k in natural): return "Natural Origin"
+    if origin == "synthetic": return "Synthetic / Artificial"
+    if origin == "natural": return "Natural Origin"
     return "Origin Unknown"
 
+def get_cached_analysis(key: str):
+    """Return a cached analysis for key, or None if missing/expired."""
+    entry = _analyze_cache.get(key)
+    if entry is None:
+        return None
+    expires, result = entry
+    if expires < time.monotonic():
+        del _analyze_cache[key]
+        return None
+    _analyze_cache.move_to_end(key)
+    return result
+
+def cache_analysis(key: str, result: dict):
+    _analyze_cache[key] = (time.monotonic() + ANALYZE_CACHE_TTL, result)
+    _analyze_cache.move_to_end(key)
+    while len(_analyze_cache) > ANALYZE_CACHE_SIZE:
+        _analyze_cache.popitem(last=False)
+
+@lru_cache(maxsize=1024)
+def quote_name(name: str) -> str:
+    """URL-encode a compound name; the same few names come up over and over."""
+    return urllib.parse.quote(name)
+
 # --- Fetchers ---
-async def fetch_off_data(client, code):
+async def with_timeout(source: str, coro, default, failed: List[str]):
+    """
+    Await coro within UPSTREAM_TIMEOUTS[source]. If it times out or the
+    upstream call fails, record the source in `failed` and return default.
+    """
     try:
-        if not code: return None
-        # Ensure code is clean (e.g. e330)
-        clean_code = code.split(' ')[0] 
-        resp = await client.get(f"{OFF_ADDITIVE_URL}/{clean_code}")
-        return resp.json() if resp.status_code == 200 else None
-    except: return None
+        return await asyncio.wait_for(coro, timeout=UPSTREAM_TIMEOUTS[source])
+    except asyncio.TimeoutError:
+        logger.warning(f"⏱️ {source} timed out after {UPSTREAM_TIMEOUTS[source]}s")
+    except Exception as e:
+        logger.warning(f"⚠️ {source} failed: {type(e).__name__}: {e}")
+    failed.append(source)
+    return default
 
-async def fetch_wiki_data(client, name):
+class CoalescedRequestCancelled(Exception):
+    """The caller that owned a coalesced GET gave up (hit its timeout) before it finished."""
+
+async def singleflight_get(client, url, params=None, extensions=None):
+    """
+    client.get() that coalesces identical concurrent requests:
+    the first caller does the real request, later callers await its result.
+    """
+    key = str(httpx.URL(url, params=params))
+    while (fut := _inflight.get(key)) is not None:
+        try:
+            # Shield so a cancelled waiter doesn't cancel the shared request
+            return await asyncio.shield(fut)
+        except CoalescedRequestCancelled:
+            # Don't inherit the owner's timeout: make the request ourselves,
+            # so our own budget decides whether this source timed out.
+            continue
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
     try:
-        if not name: return None
-        # CLEANUP: "E330 - Citric Acid" -> "Citric_Acid"
-        # 1. Remove E-code prefix if present
-        name = re.sub(r'^[eE]\d+\s*[-–]\s*', '', name)
-        
-        # 2. Format for Wiki (Title Case, Underscores)
-        clean = name.strip().title().replace(" ", "_")
-        
-        url = f"{WIKI_API_URL}/{clean}"
-        resp = await client.get(url)
-        return resp.json() if resp.status_code == 200 else None
-    except: return None
+        resp = await client.get(url, params=params, extensions=extensions)
+        fut.set_result(resp)
+        return resp
+    except asyncio.CancelledError:
+        fut.set_exception(CoalescedRequestCancelled(key))
+        fut.exception() # Mark retrieved, there may be no waiters
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception() # Mark retrieved, there may be no waiters
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+# Fetchers raise on upstream failures (errors, non-200s) so with_timeout can
+# tell "nothing found" apart from "couldn't ask" and keep the latter out of the cache.
+async def fetch_off_data(client, code):
+    if not code: return None
+    # Ensure code is clean (e.g. e330)
+    clean_code = code.split(' ')[0] 
+    # Only ask for the fields we actually read
+    params = {"fields": "display_name_translations,overexposure_risk"}
+    resp = await singleflight_get(client, f"{OFF_ADDITIVE_URL}/{clean_code}", params=params, extensions=FORCE_CACHE)
+    if resp.status_code == 404: return None # OFF doesn't know the code
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
+
+async def fetch_wiki_data(client, name):
+    if not name: return None
+    # CLEANUP: "E330 - Citric Acid" -> "Citric_Acid"
+    # 1. Remove E-code prefix if present
+    name = _E_PREFIX_RE.sub('', name)
+    
+    # 2. Format for Wiki (Title Case, Underscores)
+    clean = name.strip().title().replace(" ", "_")
+    
+    url = f"{WIKI_API_URL}/{clean}"
+    resp = await singleflight_get(client, url, extensions=FORCE_CACHE)
+    if resp.status_code == 404: return None # No article under that name
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
 
 async def fetch_usda(client, name):
     if not USDA_API_KEY or not name: return False
-    try:
-        # Cleanup name for USDA search as well
-        clean_name = re.sub(r'^[eE]\d+\s*[-–]\s*', '', name)
-        params = {"api_key": USDA_API_KEY, "query": clean_name, "dataType": ["Foundation", "SR Legacy"], "pageSize": 1}
-        resp = await client.get(USDA_ENDPOINT, params=params)
-        if resp.status_code == 200:
-            d = resp.json()
-            if d.get("totalHits", 0) > 0:
-                food_name = d["foods"][0]["description"].lower()
-                return clean_name.lower() in food_name
-    except: pass
+    # Cleanup name for USDA search as well
+    clean_name = _E_PREFIX_RE.sub('', name)
+    params = {"api_key": USDA_API_KEY, "query": clean_name, "dataType": ["Foundation", "SR Legacy"], "pageSize": 1}
+    resp = await singleflight_get(client, USDA_ENDPOINT, params=params, extensions=NO_CACHE)
+    resp.raise_for_status()
+    d = orjson.loads(resp.content)
+    if d.get("totalHits", 0) > 0:
+        food_name = d["foods"][0]["description"].lower()
+        return clean_name.lower() in food_name
     return False
 
 async def fetch_products(client, code, name):
-    try:
-        q = code if code else name
-        if not q: return []
-        params = {"additives_tags": q, "page_size": 3, "fields": "product_name,image_front_small_url"}
-        resp = await client.get(OFF_SEARCH_URL, params=params)
-        return resp.json().get("products", []) if resp.status_code == 200 else []
-    except: return []
+    q = code if code else name
+    if not q: return []
+    params = {"additives_tags": q, "page_size": 3, "fields": "product_name,image_front_small_url"}
+    resp = await singleflight_get(client, OFF_SEARCH_URL, params=params, extensions=FORCE_CACHE)
+    if resp.status_code == 404: return [] # No products for that tag
+    resp.raise_for_status()
+    return orjson.loads(resp.content).get("products", [])
 
 async def fetch_pubchem_cid(client, name):
-    try:
-        if not name: return None
-        # Remove E-code junk before asking PubChem
-        clean_name = re.sub(r'^[eE]\d+\s*[-–]\s*', '', name).strip()
-        
-        encoded_name = urllib.parse.quote(clean_name)
-        url = PUBCHEM_CID_URL.format(encoded_name)
-        
-        resp = await client.get(url)
-        if resp.status_code == 200:
-            data = resp.json()
-            cids = data.get("IdentifierList", {}).get("CID", [])
-            if cids: return cids[0]
-    except: pass
-    return None
+    if not name: return None
+    # Remove E-code junk before asking PubChem
+    clean_name = _E_PREFIX_RE.sub('', name).strip()
+    
+    encoded_name = quote_name(clean_name)
+    url = PUBCHEM_CID_URL.format(encoded_name)
+    
+    resp = await singleflight_get(client, url, extensions=FORCE_CACHE)
+    if resp.status_code == 404: return None # PubChem doesn't know the name
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+    id_list = data.get("IdentifierList")
+    cids = id_list.get("CID") if id_list else None
+    return cids[0] if cids else None
 
 # --- Endpoints ---
 @app.get("/", response_class=HTMLResponse)
@@ -200,19 +517,44 @@ async def read_index(request: Request):
 
 @app.get("/api/autocomplete")
 async def autocomplete(q: str):
-    q_lower = q.lower()
-    matches = [x for x in taxonomy_list if q_lower in x.lower()]
+    q_clean = q.lower()
+    
+    # Prefix matches: jump straight to the first candidate, walk while it still matches
+    matches = []
+    i = bisect.bisect_left(_lower_keys, q_clean)
+    while i < len(_lower_keys) and len(matches) < 10 and _lower_keys[i].startswith(q_clean):
+        matches.append(_lower_index[i][1])
+        i += 1
+    if matches:
+        return matches
+
+    # Fallback: substring anywhere in the entry
+    if len(q_clean) < 3:
+        return [orig for low, orig in _lower_index if q_clean in low][:10]
+
+    # Intersect trigram postings (smallest first), then confirm the real substring
+    postings = sorted(
+        (_trigrams.get(q_clean[j:j + 3], set()) for j in range(len(q_clean) - 2)),
+        key=len,
+    )
+    candidates = set(postings[0]).intersection(*postings[1:])
+    matches = [_lower_index[i][1] for i in sorted(candidates) if q_clean in _lower_keys[i]]
     return matches[:10]
 
 @app.get("/api/analyze/{query}")
-async def analyze_endpoint(query: str):
+async def analyze_endpoint(query: str, request: Request):
     try:
         query_clean = query.lower().strip()
+
+        # Same additive asked recently? Skip the whole upstream fan-out.
+        cached = get_cached_analysis(query_clean)
+        if cached is not None:
+            return ORJSONResponse(cached)
         
         # --- INPUT CLEANING STEP ---
         # If input is "E330 - Citric Acid", split it.
         # Regex looks for: Starts with E+digits, then separator, then Name
-        match = re.match(r"^([e]\d+)\s*[-–_]\s*(.+)$", query_clean)
+        match = _E_SPLIT_RE.match(query_clean)
         
         if match:
             e_code = match.group(1) # e330
@@ -226,25 +568,34 @@ async def analyze_endpoint(query: str):
 
         logger.info(f"Parsed -> Code: {e_code}, Name: {search_name}")
 
-        async with httpx.AsyncClient(headers=API_HEADERS, timeout=20.0) as client:
-            
-            # 1. Identity (Use Code)
-            off_data = await fetch_off_data(client, e_code)
-            
-            # 2. Resolve Canonical Name
-            # If OFF gave us a good name, prefer it. Otherwise use our cleaned search_name.
-            canonical_name = search_name
-            if off_data:
-                names = off_data.get("display_name_translations", {})
-                canonical_name = names.get("en", names.get("fr", search_name))
-            
-            logger.info(f"Canonical Name for API Search: {canonical_name}")
+        # Shared client: keep-alive connections are reused across requests
+        client = request.app.state.client
+
+        failed: List[str] = [] # Sources that timed out or errored
+
+        # 1. Identity (Use Code)
+        off_data = await with_timeout("off", fetch_off_data(client, e_code), None, failed)
+        
+        # 2. Resolve Canonical Name
+        # If OFF gave us a good name, prefer it. Otherwise use our cleaned search_name.
+        names = off_data.get("display_name_translations") if off_data else None
+        canonical_name = (names.get("en") or names.get("fr") or search_name) if names else search_name
+        
+        logger.info(f"Canonical Name for API Search: {canonical_name}")
+
+        # 3. Parallel Fetch (Use Name)
+        prod_task = with_timeout("products", fetch_products(client, e_code, canonical_name), [], failed)
 
-            # 3. Parallel Fetch (Use Name)
-            wiki_task = fetch_wiki_data(client, canonical_name)
-            usda_task = fetch_usda(client, canonical_name)
-            prod_task = fetch_products(client, e_code, canonical_name)
-            cid_task = fetch_pubchem_cid(client, canonical_name)
+        name_known = not _E_CODE_RE.fullmatch(canonical_name.strip())
+        if not name_known:
+            # No real name known: Wikipedia/USDA/PubChem would only 404 on a bare code
+            logger.info("No name for code, skipping name-based lookups")
+            wiki_data, usda_verified, pubchem_cid = None, False, None
+            products = await prod_task
+        else:
+            wiki_task = with_timeout("wiki", fetch_wiki_data(client, canonical_name), None, failed)
+            usda_task = with_timeout("usda", fetch_usda(client, canonical_name), False, failed)
+            cid_task = with_timeout("pubchem", fetch_pubchem_cid(client, canonical_name), None, failed)
             
             wiki_data, usda_verified, products, pubchem_cid = await asyncio.gather(
                 wiki_task, usda_task, prod_task, cid_task
@@ -265,12 +616,11 @@ async def analyze_endpoint(query: str):
         img_url = ""
         if pubchem_cid:
             img_url = PUBCHEM_IMG_URL.format(pubchem_cid)
-        else:
-            # Last resort fallback
-            safe_name = urllib.parse.quote(canonical_name)
-            img_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{safe_name}/PNG?record_type=2d&image_size=300x300"
+        elif name_known:
+            # Last resort fallback (pointless for a bare code, the browser would just get a 404)
+            img_url = PUBCHEM_NAME_IMG_URL.format(quote_name(canonical_name))
 
-        return JSONResponse({
+        result = {
             "identity": {
                 "name": canonical_name.title(),
                 "code": e_code.upper() if e_code else "Unknown"
@@ -281,9 +631,14 @@ async def analyze_endpoint(query: str):
             "usda_verified": usda_verified,
             "structure_image": img_url,
             "products": products
-        })
+        }
+        # Only cache complete answers; after a failure the next request should ask again.
+        # Without a taxonomy, names can't be resolved to codes yet, so don't cache either.
+        if not failed and additive_taxonomy:
+            cache_analysis(query_clean, result)
+        return ORJSONResponse(result)
 
     except Exception as e:
-        error_msg = traceback.format_exc()
-        logger.error(f"❌ BACKEND ERROR:\n{error_msg}")
-        return JSONResponse(status_code=500, content={"detail": str(e)})
+        # Traceback is only formatted if the log record is actually emitted
+        logger.exception("❌ BACKEND ERROR for query=%s", query)
+        return ORJSONResponse(status_code=500, content={"detail": str(e)})